@@ -0,0 +1,68 @@
+"""Shared pytest fixtures: a synthetic local GHCN-Daily tree.
+
+"""
+
+# pylint: disable=invalid-name, locally-disabled
+
+import calendar
+import pytest
+
+import ghcn
+
+
+def write_dly(path, id_, elems, qflags=()):
+    """Write one station's DLY file.
+
+    elems looks like {'TMAX': {1999: [366 raw values]}}, in the 366 day
+    layout used by ghcndata_to_array(); None marks a missing day.
+    qflags is a collection of (elem, year, day_index) to flag 'X'.
+
+    """
+    with open(path, 'w') as outfile:
+        for elem, years in elems.items():
+            for year, vals in sorted(years.items()):
+                for m in range(1, 13):
+                    n_days = calendar.monthrange(year, m)[1]
+                    line = id_ + str(year) + '{0:02d}'.format(m) + elem
+                    for d in range(31):
+                        i = ghcn.MONTH_BGN[m - 1] + d
+                        val = vals[i] if d < n_days else None
+                        val = -9999 if val is None else int(val)
+                        qflag = 'X' if (elem, year, i) in qflags else ' '
+                        line += '{0:5d}'.format(val) + ' ' + qflag + ' '
+                    outfile.write(line + '\n')
+
+
+@pytest.fixture
+def make_ghcn(tmp_path, capsys):
+    """Return a factory that writes a GHCN tree and loads it with Ghcn.
+
+    The factory takes {id_: {'lat': .., 'lng': .., 'elems': {...},
+    'qflags': {...}}}; see write_dly().
+
+    """
+
+    def factory(stations, elems=('TMAX', )):
+        data_path = tmp_path / 'ghcnd_all'
+        docs_path = tmp_path / 'docs'
+        data_path.mkdir()
+        docs_path.mkdir()
+
+        with open(str(docs_path / 'ghcnd-stations.txt'), 'w') as st_file, \
+                open(str(docs_path / 'ghcnd-inventory.txt'), 'w') as inv_file:
+            for id_, station in sorted(stations.items()):
+                latlng = '{0} {1:8.4f} {2:9.4f}'.format(
+                    id_, station['lat'], station['lng'])
+                st_file.write(latlng + ' {0:6.1f} NAME\n'.format(100.0))
+                for elem, years in station['elems'].items():
+                    inv_file.write(latlng + ' ' + elem +
+                                   ' {0} {1}\n'.format(min(years), max(years)))
+
+                write_dly(str(data_path / (id_ + '.dly')), id_,
+                          station['elems'], station.get('qflags', ()))
+
+        ghcn_obj = ghcn.Ghcn(str(tmp_path), 'ghcnd_all', 'docs', elems)
+        capsys.readouterr()
+        return ghcn_obj
+
+    return factory
@@ -0,0 +1,307 @@
+"""Whole-network analytics over many GHCN stations.
+
+A Corpus is a lazy plan: filter(), resample(), groupby() and reduce() each
+return a new Corpus and read no data files. compute() then reads the
+stations chunk by chunk across worker processes, keeping only per-group,
+per-period partial sums, so memory is bounded by the size of the result
+rather than by the number of stations or days. E.g. annual mean TMAX
+per station:
+
+    crp = corpus.Corpus(ghcn_obj, ('TMAX', ))
+    df = crp.filter(min_yrs=25).resample('annual').reduce('mean').compute()
+
+Temperatures are in ºF; other elements keep GHCN's own units, e.g. tenths
+of mm for PRCP and mm for SNOW and SNWD. Days that failed NOAA's quality
+checks are treated as missing unless the Corpus is made with qc=False.
+
+"""
+
+# pylint: disable=invalid-name, locally-disabled
+
+import math
+import functools
+import numpy as np
+import pandas as pd
+
+import ghcn
+
+__author__ = "Phil Beffrey"
+__copyright__ = "Copyright (c) 2019, Phil Beffrey"
+__license__ = "MIT"
+__version__ = "0.0.1"
+
+FREQS = (None, 'monthly', 'annual')
+GROUPINGS = ('station', 'country', 'grid')
+REDUCTIONS = ('mean', 'sum', 'min', 'max', 'count')
+
+_PERIOD_COLS = {None: [], 'monthly': ['year', 'month'], 'annual': ['year']}
+_STATS = {'sum': 'sum', 'count': 'sum', 'min': 'min', 'max': 'max'}
+# Number of chunk results compute() holds before folding them together.
+_FOLD_EVERY = 32
+
+
+def _period_stats(values, freq):
+    """Return per-period sum, count, min and max, skipping NaNs.
+
+    Intended to be private to this module.
+    values is (n_years, 366), as from ghcn.ghcndata_to_array(); each
+    returned array is (n_years, n_periods), or (1, 1) if freq is None.
+
+    """
+    if freq is None:
+        values = values.reshape(1, -1)
+    bgn = ghcn.MONTH_BGN if freq == 'monthly' else [0]
+
+    good = np.isfinite(values)
+    return {
+        'sum': np.add.reduceat(np.where(good, values, 0.0), bgn, axis=1),
+        'count': np.add.reduceat(good.astype(int), bgn, axis=1),
+        'min': np.fmin.reduceat(values, bgn, axis=1),
+        'max': np.fmax.reduceat(values, bgn, axis=1)
+    }
+
+
+def _group_key(mdata, by, grid_deg):
+    """Return the group a station belongs to.
+
+    Intended to be private to this module.
+
+    """
+    if by == 'station':
+        return mdata['id']
+    if by == 'country':
+        return mdata['id'][:2]  # FIPS country code.
+    if by == 'grid':
+        return (math.floor(mdata['lat'] / grid_deg) * grid_deg,
+                math.floor(mdata['lng'] / grid_deg) * grid_deg)
+    return by(mdata)
+
+
+def _aggregate(frames, keys):
+    """Combine partial frames of sum/count/min/max by keys.
+
+    Intended to be private to this module.
+
+    """
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=keys + list(_STATS))
+    df = pd.concat(frames, ignore_index=True)
+    return df.groupby(keys, sort=False,
+                      dropna=False).agg(_STATS).reset_index()
+
+
+def _corpus_chunk(plan, ghcn_obj, ids):
+    """Compute partial aggregates for a chunk of stations.
+
+    Intended to be private to this module; runs in a worker process.
+
+    """
+    freq = plan['freq']
+    keys = ['elem', 'group'] + _PERIOD_COLS[freq]
+    frames = []
+    for id_ in ids:
+        ghcn_data = ghcn_obj.file_to_data(id_ + '.dly',
+                                          plan['elems'],
+                                          qc=plan['qc'],
+                                          native=True)
+        if not ghcn_data['data']:
+            continue
+
+        group = _group_key(ghcn_data['metadata'], plan['by'],
+                           plan['grid_deg'])
+        for elem in plan['elems']:
+            arr = ghcn.ghcndata_to_array(ghcn_data['data'], elem)
+            if not len(arr['years']):
+                continue
+
+            stats = _period_stats(arr['values'], freq)
+            n_years, n_periods = stats['sum'].shape
+            part = {k: v.ravel() for k, v in stats.items()}
+            if freq is not None:
+                part['year'] = np.repeat(arr['years'], n_periods)
+            if freq == 'monthly':
+                part['month'] = np.tile(np.arange(1, 13), n_years)
+
+            df = pd.DataFrame(part)
+            df = df[df['count'] > 0]
+            df.insert(0, 'group', [group] * len(df))
+            df.insert(0, 'elem', elem)
+            frames.append(df)
+
+    return _aggregate(frames, keys)
+
+
+class Corpus:
+    """Lazy, chunked view of many stations' data for one or more elements.
+
+    Build a plan with filter(), resample(), groupby() and reduce(), then
+    run it with compute(). Each of those returns a new Corpus; the
+    original is unchanged, so partial plans can be shared and reused.
+
+    """
+
+    def __init__(self, ghcn_obj, elems=None, qc=True):
+        """Caller passes a Ghcn object and, optionally, elements to load.
+
+        elems defaults to the Ghcn object's own elements; a single element
+        name, e.g. 'TMAX', is also accepted. If qc, days that failed quality
+        checks are treated as missing.
+
+        """
+        elems = elems or ghcn_obj.elements
+        if isinstance(elems, str):
+            elems = (elems, )
+
+        self.ghcn_obj = ghcn_obj
+        self.plan = {
+            'elems': tuple(elems),
+            'qc': qc,
+            'filters': (),
+            'freq': None,
+            'by': 'station',
+            'grid_deg': 5.0,
+            'how': 'mean',
+            'min_count': 1
+        }
+
+    def __repr__(self):
+        return 'Corpus(' + ', '.join(
+            k + '=' + repr(v) for k, v in self.plan.items()) + ')'
+
+    def _replace(self, **changes):
+        """Return a copy of this Corpus with changes made to its plan.
+
+        """
+        crp = Corpus(self.ghcn_obj, self.plan['elems'], self.plan['qc'])
+        crp.plan = dict(self.plan, **changes)
+        return crp
+
+    def filter(self, elem_name=None, min_yrs=0, must_include=-1, prefix=''):
+        """Keep only stations meeting Ghcn.get_stations() criteria.
+
+        Repeated filters must all be met.
+
+        Args:
+            elem_name: Element the station must record; defaults to the
+                first of the Corpus's elements.
+            min_yrs, must_include: See Ghcn.get_stations().
+            prefix: Station id prefix, e.g. 'US' or 'USW'.
+
+        """
+        elem_name = elem_name or self.plan['elems'][0]
+        return self._replace(filters=self.plan['filters'] +
+                             ((elem_name, min_yrs, must_include, prefix), ))
+
+    def resample(self, freq):
+        """Reduce days to 'monthly' or 'annual' periods, or None for all.
+
+        """
+        if freq not in FREQS:
+            raise ValueError('freq must be one of ' + str(FREQS))
+        return self._replace(freq=freq)
+
+    def groupby(self, by, grid_deg=5.0):
+        """Group stations before reducing.
+
+        Args:
+            by: 'station', 'country' (the 2 letter id prefix), 'grid'
+                (grid_deg x grid_deg lat/lng cells, keyed by their
+                south-west corner), or a function taking station metadata
+                and returning a key. The function must be picklable,
+                i.e. defined at module level, to use worker processes.
+                Stations for which it returns None form their own group.
+
+        """
+        if by not in GROUPINGS and not callable(by):
+            raise ValueError('by must be callable or one of ' +
+                             str(GROUPINGS))
+        return self._replace(by=by, grid_deg=grid_deg)
+
+    def reduce(self, how='mean', min_count=1):
+        """Reduce each group and period to a single value.
+
+        All valid days of all the group's stations are pooled, so 'mean'
+        weights stations by their number of valid days.
+
+        Args:
+            how: One of REDUCTIONS.
+            min_count: Fewer valid days than this gives NaN.
+
+        """
+        if how not in REDUCTIONS:
+            raise ValueError('how must be one of ' + str(REDUCTIONS))
+        return self._replace(how=how, min_count=min_count)
+
+    def stations(self):
+        """Return the list (metadata) of stations that pass all filters.
+
+        """
+        ghcn_obj = self.ghcn_obj
+        filters = self.plan['filters']
+        if not filters:
+            ids = set()
+            for elem in self.plan['elems']:
+                ids.update(s['id'] for s in ghcn_obj.get_stations(elem))
+        else:
+            ids = None
+            for elem, min_yrs, must_include, prefix in filters:
+                found = set(s['id']
+                            for s in ghcn_obj.get_stations(
+                                elem, min_yrs, must_include)
+                            if s['id'].startswith(prefix))
+                ids = found if ids is None else ids & found
+
+        return [ghcn_obj.station_metadata[id_] for id_ in sorted(ids)]
+
+    def compute(self, n_workers=None, chunk_size=100):
+        """Execute the plan and return the result as a DataFrame.
+
+        Columns are 'elem', the grouping ('station', 'country', 'grid' or
+        'group'), 'year' and 'month' as resampled, then 'value' and
+        'count', the number of valid days behind each value.
+
+        Args:
+            n_workers, chunk_size: See ghcn.map_stations().
+
+        """
+        plan = self.plan
+        keys = ['elem', 'group'] + _PERIOD_COLS[plan['freq']]
+        ids = [s['id'] for s in self.stations()]
+        work_fn = functools.partial(_corpus_chunk, plan)
+
+        # Fold partials in batches so memory stays bounded by the result.
+        # A station never spans two chunks, so per-station parts are
+        # already final and are just concatenated once at the end.
+        fold = plan['by'] != 'station'
+        df = _aggregate([], keys)
+        pending = []
+        for part in ghcn.map_stations(self.ghcn_obj, ids, work_fn, n_workers,
+                                      chunk_size):
+            if part.empty:
+                continue
+            pending.append(part)
+            if fold and len(pending) >= _FOLD_EVERY:
+                df = _aggregate([df] + pending, keys)
+                pending = []
+        if fold:
+            df = _aggregate([df] + pending, keys)
+        elif pending:
+            df = pd.concat(pending, ignore_index=True)
+
+        how = plan['how']
+        count = df['count'].astype(int)
+        if how == 'mean':
+            value = df['sum'] / count.where(count > 0)
+        elif how == 'count':
+            value = count.astype(float)
+        else:
+            value = df[how].astype(float)
+        df['value'] = value.where(count >= plan['min_count'])
+        df['count'] = count
+
+        group_col = plan['by'] if plan['by'] in GROUPINGS else 'group'
+        df = df[keys + ['value', 'count']].rename(columns={'group': group_col})
+        return df.sort_values(['elem', group_col] +
+                              _PERIOD_COLS[plan['freq']]).reset_index(
+                                  drop=True)
@@ -0,0 +1,184 @@
+"""Detect extreme events, e.g. heat waves, in GHCN data.
+
+An event is a run of consecutive days on which a station's element is
+above (or below) that station's own percentile threshold. Missing days
+are never imputed here, so they always end a run. By default, days that
+failed NOAA's quality checks count as missing, too.
+
+"""
+
+# pylint: disable=invalid-name, locally-disabled
+
+import datetime
+import functools
+import math
+import numpy as np
+import pandas as pd
+
+import ghcn
+
+__author__ = "Phil Beffrey"
+__copyright__ = "Copyright (c) 2019, Phil Beffrey"
+__license__ = "MIT"
+__version__ = "0.0.1"
+
+EVENT_COLUMNS = ('station', 'start', 'length', 'peak')
+
+
+def percentile_threshold(values, pct):
+    """Return the pct percentile of the non-NaN values (NaN if there are none).
+
+    """
+    values = np.asarray(values, dtype=float)
+    if not np.isfinite(values).any():
+        return float('nan')
+    return float(np.nanpercentile(values, pct))
+
+
+def find_runs(values, ordinals, thresh, min_len=1, above=True):
+    """Find runs of consecutive days beyond thresh.
+
+    Vectorized with diff and reduceat; no Python loop over days.
+
+    Args:
+        values: 1D array of daily values in date order; NaN for missing days.
+        ordinals: 1D array of the matching day ordinals. A gap between
+            ordinals (e.g. a missing year) ends a run.
+        thresh: Values strictly above (or below, if not above) this count.
+        min_len: Shortest run to return.
+
+    Returns:
+        Dictionary of 1D arrays: 'start' (ordinal), 'length' and 'peak'.
+
+    """
+    values = np.asarray(values, dtype=float)
+    ordinals = np.asarray(ordinals, dtype=int)
+    with np.errstate(invalid='ignore'):  # NaN compares False, ending runs.
+        hit = values > thresh if above else values < thresh
+
+    # A run starts on any hit day that doesn't directly follow another hit.
+    follows = np.zeros(len(hit), dtype=bool)
+    follows[1:] = hit[:-1] & (np.diff(ordinals) == 1)
+    is_start = hit & ~follows
+
+    hit_idx = np.flatnonzero(hit)
+    start_pos = np.flatnonzero(is_start[hit_idx])
+    if not len(start_pos):
+        return {
+            'start': np.empty(0, dtype=int),
+            'length': np.empty(0, dtype=int),
+            'peak': np.empty(0, dtype=float)
+        }
+
+    length = np.diff(np.append(start_pos, len(hit_idx)))
+    reduce_fn = np.maximum if above else np.minimum
+    peak = reduce_fn.reduceat(values[hit_idx], start_pos)
+    start = ordinals[hit_idx[start_pos]]
+
+    keep = length >= min_len
+    return {'start': start[keep], 'length': length[keep], 'peak': peak[keep]}
+
+
+def station_events(ghcn_obj,
+                   id_,
+                   elem_name,
+                   pct=90,
+                   min_len=3,
+                   above=True,
+                   qc=True):
+    """Find one station's events for elem_name.
+
+    Returns a dictionary of column lists (see EVENT_COLUMNS), empty if the
+    station has no data for the element. Peaks are in ºF for temperatures
+    and in GHCN's own units otherwise.
+    qc: If True, days with a QFLAG are treated as missing.
+
+    """
+    part = {c: [] for c in EVENT_COLUMNS}
+    ghcn_data = ghcn_obj.file_to_data(id_ + '.dly', (elem_name, ),
+                                      qc=qc,
+                                      native=True)
+    if not ghcn_data['data']:
+        return part
+
+    arr = ghcn.ghcndata_to_array(ghcn_data['data'], elem_name)
+    days = ghcn.day_ordinals(arr['years'])
+    values = arr['values'][days['valid']]  # Row-major, so in date order.
+    ordinals = days['ordinals'][days['valid']]
+
+    thresh = percentile_threshold(values, pct)
+    if math.isnan(thresh):  # No good values at all.
+        return part
+
+    runs = find_runs(values, ordinals, thresh, min_len, above)
+    part['station'] = [id_] * len(runs['start'])
+    part['start'] = [datetime.date.fromordinal(int(o)) for o in runs['start']]
+    part['length'] = runs['length'].tolist()
+    part['peak'] = runs['peak'].tolist()
+    return part
+
+
+def merge_parts(parts):
+    """Merge partial results into one dictionary of column lists.
+
+    """
+    merged = {c: [] for c in EVENT_COLUMNS}
+    for part in parts:
+        for c in EVENT_COLUMNS:
+            merged[c].extend(part[c])
+    return merged
+
+
+def merge_events(parts):
+    """Merge partial results (dictionaries of column lists) into a DataFrame.
+
+    """
+    df = pd.DataFrame(merge_parts(parts), columns=list(EVENT_COLUMNS))
+    df['start'] = pd.to_datetime(df['start'])
+    return df.sort_values(['station', 'start']).reset_index(drop=True)
+
+
+def _events_chunk(elem_name, pct, min_len, above, qc, ghcn_obj, ids):
+    """Find events for a chunk of stations; runs in a worker process.
+
+    Intended to be private to this module.
+
+    """
+    return merge_parts(
+        station_events(ghcn_obj, id_, elem_name, pct, min_len, above, qc)
+        for id_ in ids)
+
+
+def detect_events(ghcn_obj,
+                  stations,
+                  elem_name='TMAX',
+                  pct=90,
+                  min_len=3,
+                  above=True,
+                  qc=True,
+                  n_workers=None,
+                  chunk_size=100):
+    """Find events for every station, in parallel.
+
+    For heat waves, e.g., runs of 3+ days above each station's 90th
+    percentile of TMAX:
+        stations = ghcn_obj.get_stations('TMAX', min_yrs=25)
+        df = events.detect_events(ghcn_obj, stations, 'TMAX', 90, 3)
+
+    Args:
+        stations: List of station metadata, as from Ghcn.get_stations().
+        above: If False, find runs below the threshold (e.g. cold spells)
+            and report the minimum as the peak.
+        qc: If True, days that failed quality checks are treated as missing
+            so they can't create false events or peaks.
+        n_workers, chunk_size: See ghcn.map_stations().
+
+    Returns:
+        DataFrame with one row per event: station, start, length, peak.
+
+    """
+    work_fn = functools.partial(_events_chunk, elem_name, pct, min_len, above,
+                                qc)
+    ids = [s['id'] for s in stations]
+    return merge_events(
+        ghcn.map_stations(ghcn_obj, ids, work_fn, n_workers, chunk_size))
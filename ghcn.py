@@ -10,6 +10,8 @@ import os
 import time
 import datetime
 import math
+import multiprocessing
+import numpy as np
 import pandas as pd
 
 __author__ = "Phil Beffrey"
@@ -17,6 +19,9 @@ __copyright__ = "Copyright (c) 2019, Phil Beffrey"
 __license__ = "MIT"
 __version__ = "0.0.1"
 
+# Elements in tenths of ºC, which get converted to ºF.
+TEMPERATURE_ELEMS = ('TMAX', 'TMIN', 'TAVG')
+
 
 def _valsfromstr(line):
     """Create tuple of values parsed from a line in a DLY data file.
@@ -40,10 +45,14 @@ def _valsfromstr(line):
     return vals
 
 
-def _create_data_desc(data, elems):
+def _create_data_desc(data, elems, qc=False, native=False):
     """Convert list of tuples from data file into data 'dictionary'.
 
     Intended to be private to this module.
+    If qc, values with a (non-blank) QFLAG, i.e. that failed NOAA's quality
+    checks, are replaced with NaN just like missing values.
+    If native, only TEMPERATURE_ELEMS are converted to ºF; other elements
+    keep GHCN's own units (e.g. tenths of mm for PRCP, mm for SNOW).
     The returned object looks something like this...
         [
             {
@@ -67,6 +76,7 @@ def _create_data_desc(data, elems):
         months = ((1, 31), (2, 29), (3, 31), (4, 30), (5, 31), (6, 30),
                   (7, 31), (8, 31), (9, 30), (10, 31), (11, 30), (12, 31))
 
+        to_f = not native or x in TEMPERATURE_ELEMS
         df = {}
         for y in keys:
             year_rec = data[x][y]
@@ -77,9 +87,15 @@ def _create_data_desc(data, elems):
                     mnth_rec = year_rec[m[0]]
                     for d in range(0, n_days * 4, 4):
                         val = int(mnth_rec[d])
+                        if qc and mnth_rec[d + 2] != ' ':
+                            val = -9999
                         # Replace 'bad' value with NaN or convert good value to ºF.
-                        val = float('nan') if val == -9999 else round(
-                            val * 0.18 + 32, 2)
+                        if val == -9999:
+                            val = float('nan')
+                        elif to_f:
+                            val = round(val * 0.18 + 32, 2)
+                        else:
+                            val = float(val)
                         df[y].append(val)
                 except KeyError:
                     for d in range(0, n_days):
@@ -271,7 +287,13 @@ class Ghcn:
 
         return stations
 
-    def file_to_data(self, file, elems, mk_histo=False, min_yrs=0):
+    def file_to_data(self,
+                     file,
+                     elems,
+                     mk_histo=False,
+                     min_yrs=0,
+                     qc=False,
+                     native=False):
         """Read station file and convert to (local format) data dictionary.
 
         Some stations may not have the element type(s) we're interested in.
@@ -282,6 +304,10 @@ class Ghcn:
             elems: Tuple of elements to load and process, e.g.:
                 ('TMAX', 'TMIN', 'PRCP', 'SNOW', 'SNWD')
                 Note that almost all stations capture TMAX, PRCP, or both.
+            qc: If True, treat values that failed quality checks as missing.
+            native: If True, convert only temperatures to ºF and leave
+                other elements in GHCN's units. By default every element
+                is converted, which is only meaningful for temperatures.
 
         """
         with open(os.path.join(self.data_path, file)) as infile:
@@ -332,7 +358,7 @@ class Ghcn:
 
                 data[elem][year][mnth] = _valsfromstr(line)
 
-        return _create_data_desc(data, elems)
+        return _create_data_desc(data, elems, qc, native)
 
 
 """numpy genfromtxt() is an alternative for parsing lines.
@@ -396,12 +422,69 @@ def ghcndata_to_dataframe(gd, elem_name):
     return df
 
 
-def report_elapsed(t_bgn, n_files, n_lines):
+# Index of the first day of each month in the 366 day (leap year) layout
+# used by _create_data_desc() and ghcndata_to_array().
+MONTH_BGN = (0, 31, 60, 91, 121, 152, 182, 213, 244, 274, 305, 335)
+
+
+def ghcndata_to_array(gd, elem_name):
+    """Convert GHCN data description to NumPy arrays, without filling in NaNs.
+
+    Accepts either the list from Ghcn.file_to_data()['data'] or one of its
+    items, as passed to ghcndata_to_dataframe().
+    Returns a dictionary holding 'years', a (n_years, ) int array, and
+    'values', a (n_years, 366) float array in which missing days stay NaN.
+    Feb 29 of a non-leap year is always NaN. Both arrays are empty if the
+    element isn't present. Values are in whatever units file_to_data()
+    produced; pass it native=True for non-temperature elements.
+
+    """
+    if isinstance(gd, dict):
+        gd = [gd]
+
+    elem_data = {}
+    for x in gd:
+        if not isinstance(x, dict):
+            raise TypeError('expected a GHCN data description (list or dict)')
+        if elem_name in x:
+            elem_data = x[elem_name]
+            break
+
+    years = np.array(sorted(elem_data), dtype=int)
+    values = np.array([elem_data[y] for y in years], dtype=float)
+    values = values.reshape(len(years), 366)
+    values[values == -9999] = np.nan  # Padding from _create_data_desc().
+    return {'years': years, 'values': values}
+
+
+def day_ordinals(years):
+    """Return (n_years, 366) proleptic Gregorian ordinals for each cell.
+
+    Companion to ghcndata_to_array(). Feb 29 of a non-leap year gets the
+    same ordinal as Mar 1; use the returned 'valid' mask to drop it.
+
+    """
+    years = np.asarray(years, dtype=int)
+    leap = (years % 4 == 0) & ((years % 100 != 0) | (years % 400 == 0))
+    jan_1 = np.array([datetime.date(y, 1, 1).toordinal() for y in years],
+                     dtype=int)
+    offs = np.arange(366)
+    offs = np.where(leap[:, None], offs, offs - (offs > 59))
+    valid = leap[:, None] | (np.arange(366) != 59)
+    return {'ordinals': jan_1[:, None] + offs, 'valid': valid}
+
+
+def report_elapsed(t_bgn, n_files, n_lines=None):
     """Report progress when called.
 
+    n_lines is left out of the report if None.
+
     """
-    print("elapsed = " + "{0:.2f}".format(round(time.time() - t_bgn, 2)) +
-          " n_files = " + str(n_files) + " n_lines = " + str(n_lines))
+    msg = ("elapsed = " + "{0:.2f}".format(round(time.time() - t_bgn, 2)) +
+           " n_files = " + str(n_files))
+    if n_lines is not None:
+        msg += " n_lines = " + str(n_lines)
+    print(msg)
 
 
 def only_1st_and_lst(items):
@@ -478,3 +561,69 @@ def remove_if_element_missing(stations, elem_name):
             i += 1
 
     return removed
+
+
+_WORKER_GHCN = None
+
+
+def _init_worker(ghcn_obj):
+    """Hold one Ghcn object per worker process.
+
+    Intended to be private to this module.
+
+    """
+    global _WORKER_GHCN
+    _WORKER_GHCN = ghcn_obj
+
+
+def _run_chunk(args):
+    """Call work_fn on one chunk of station ids in a worker process.
+
+    Intended to be private to this module.
+
+    """
+    work_fn, ids = args
+    return work_fn(_WORKER_GHCN, ids), len(ids)
+
+
+def map_stations(ghcn_obj,
+                 ids,
+                 work_fn,
+                 n_workers=None,
+                 chunk_size=100,
+                 t_bgn=None):
+    """Call work_fn(ghcn_obj, ids_chunk) across worker processes.
+
+    Parallel counterpart to for_each_station(), but takes a list of station
+    ids rather than station metadata, and work_fn reads its own files rather
+    than being handed each converted station. Yields each chunk's partial
+    result as soon as it's ready (in no particular order); the caller is
+    expected to merge them. work_fn must be picklable, e.g. a module-level
+    function or a functools.partial of one. The Ghcn object is sent once to
+    each worker rather than once per chunk.
+
+    Args:
+        n_workers: Number of processes; None uses all cores and 1 runs
+            everything in this process.
+        chunk_size: Number of stations per task.
+
+    """
+    t_bgn = time.time() if t_bgn is None else t_bgn
+    ids = list(ids)
+    tasks = [(work_fn, ids[i:i + chunk_size])
+             for i in range(0, len(ids), chunk_size)]
+
+    n_files = 0
+    if n_workers == 1:
+        for work_fn_, chunk in tasks:
+            n_files += len(chunk)
+            part = work_fn_(ghcn_obj, chunk)
+            report_elapsed(t_bgn, n_files)
+            yield part
+        return
+
+    with multiprocessing.Pool(n_workers, _init_worker, (ghcn_obj, )) as pool:
+        for part, n_ids in pool.imap_unordered(_run_chunk, tasks):
+            n_files += n_ids
+            report_elapsed(t_bgn, n_files)
+            yield part
@@ -0,0 +1,184 @@
+"""Tests for corpus.py.
+
+"""
+
+# pylint: disable=invalid-name, locally-disabled
+
+import numpy as np
+import pytest
+
+import corpus
+
+
+def station(id_, lat, lng, years, elems=('TMAX', 'PRCP'), seed=0, qflags=()):
+    """Build a station with random raw values; every 10th day missing."""
+    rng = np.random.RandomState(seed)
+    data = {}
+    for elem in elems:
+        data[elem] = {}
+        for y in years:
+            vals = rng.randint(0, 101, size=366).tolist()
+            vals[::10] = [None] * len(vals[::10])
+            data[elem][y] = vals
+    return {id_: {'lat': lat, 'lng': lng, 'elems': data, 'qflags': qflags}}
+
+
+def network():
+    """Return a small network: two US stations and two in Canada."""
+    stations = {}
+    stations.update(station('USC00000001', 40.5, -100.5, (1999, 2000), seed=1))
+    stations.update(station('USC00000002', 41.5, -101.5, (2000, ), seed=2))
+    stations.update(station('CA000000003', 50.5, -80.5, (1999, 2000), seed=3))
+    stations.update(station('CA000000004', 56.5, -80.5, (2000, ), seed=4))
+    return stations
+
+
+def station_year(ghcn_obj, id_, elem, year):
+    """Return one station-year's values, read the slow way, NaN if missing."""
+    ghcn_data = ghcn_obj.file_to_data(id_ + '.dly', (elem, ), native=True)
+    return np.array(ghcn_data['data'][0][elem][year], dtype=float)
+
+
+def test_period_stats_month_boundaries():
+    values = np.arange(366, dtype=float).reshape(1, 366)
+    stats = corpus._period_stats(values, 'monthly')
+    lengths = [31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+    assert stats['count'][0].tolist() == lengths
+    assert stats['min'][0].tolist() == np.cumsum([0] + lengths[:-1]).tolist()
+    assert stats['max'][0].tolist() == (np.cumsum(lengths) - 1).tolist()
+
+    values[0, 59] = np.nan  # Feb 29 in a non-leap year.
+    stats = corpus._period_stats(values, 'monthly')
+    assert stats['count'][0][1] == 28
+    assert stats['max'][0][1] == 58
+
+    stats = corpus._period_stats(values, None)
+    assert stats['count'].tolist() == [[365]]
+    assert stats['sum'].tolist() == [[np.nansum(values)]]
+
+
+def test_annual_mean_per_station(make_ghcn):
+    ghcn_obj = make_ghcn(network())
+    df = corpus.Corpus(ghcn_obj).resample('annual').compute(n_workers=1)
+
+    assert list(df.columns) == ['elem', 'station', 'year', 'value', 'count']
+    assert len(df) == 6
+    for row in df.itertuples():
+        vals = station_year(ghcn_obj, row.station, 'TMAX', row.year)
+        assert row.count == np.isfinite(vals).sum()
+        assert row.value == pytest.approx(np.nanmean(vals))
+
+
+def test_single_element_name(make_ghcn):
+    ghcn_obj = make_ghcn(network())
+    crp = corpus.Corpus(ghcn_obj, 'PRCP')
+    assert crp.plan['elems'] == ('PRCP', )
+    assert len(crp.resample('annual').compute(n_workers=1)) == 6
+
+
+def test_non_temperature_units(make_ghcn):
+    ghcn_obj = make_ghcn(network())
+    crp = corpus.Corpus(ghcn_obj, ('TMAX', 'PRCP')).resample('annual')
+    df = crp.reduce('sum').compute(n_workers=1)
+
+    prcp = df[df['elem'] == 'PRCP']
+    assert len(prcp) == 6
+    for row in prcp.itertuples():
+        vals = station_year(ghcn_obj, row.station, 'PRCP', row.year)
+        assert row.value == pytest.approx(np.nansum(vals))
+    # Raw values are 0-100 tenths of mm, not ºF.
+    means = crp.compute(n_workers=1)
+    assert means[means['elem'] == 'PRCP']['value'].between(40, 60).all()
+    assert means[means['elem'] == 'TMAX']['value'].between(32, 50).all()
+
+
+def test_qc_flagged_days_are_missing(make_ghcn):
+    stations = station('USC00000001',
+                       40.5,
+                       -100.5, (2000, ),
+                       elems=('TMAX', ),
+                       qflags={('TMAX', 2000, 1), ('TMAX', 2000, 2)})
+    ghcn_obj = make_ghcn(stations)
+
+    checked = corpus.Corpus(ghcn_obj).reduce('count').compute(n_workers=1)
+    unchecked = corpus.Corpus(ghcn_obj, qc=False).reduce('count').compute(
+        n_workers=1)
+    assert checked['count'][0] == unchecked['count'][0] - 2
+
+
+def test_filter(make_ghcn):
+    ghcn_obj = make_ghcn(network())
+    crp = corpus.Corpus(ghcn_obj)
+
+    assert [s['id'] for s in crp.filter(prefix='CA').stations()] == \
+        ['CA000000003', 'CA000000004']
+    assert [s['id'] for s in crp.filter(min_yrs=2).filter(
+        prefix='US').stations()] == ['USC00000001']
+
+
+def test_groupby(make_ghcn):
+    ghcn_obj = make_ghcn(network())
+    crp = corpus.Corpus(ghcn_obj).reduce('count')
+
+    by_country = crp.groupby('country').compute(n_workers=1)
+    by_station = crp.compute(n_workers=1)
+    assert by_country['country'].tolist() == ['CA', 'US']
+    assert by_country['count'].sum() == by_station['count'].sum()
+
+    by_grid = crp.groupby('grid', grid_deg=5.0).compute(n_workers=1)
+    assert by_grid['grid'].tolist() == [(40.0, -105.0), (50.0, -85.0),
+                                        (55.0, -85.0)]
+
+    by_fn = crp.groupby(us_only).compute(n_workers=1)
+    assert len(by_fn) == 2  # Non-US stations are kept under None.
+    assert by_fn['count'].sum() == by_station['count'].sum()
+
+
+def us_only(mdata):
+    """Group key for test_groupby(); module level so it can be pickled."""
+    return 'US' if mdata['id'].startswith('US') else None
+
+
+def test_batched_folding_and_pool(make_ghcn, monkeypatch):
+    stations = {}
+    for i in range(12):
+        country = ('US', 'CA', 'MX')[i % 3]
+        stations.update(
+            station(country + 'C000000' + '{0:02d}'.format(i),
+                    10.0 + i,
+                    -100.0, (1999, 2000),
+                    seed=i))
+    ghcn_obj = make_ghcn(stations)
+    crp = corpus.Corpus(ghcn_obj, ('TMAX', 'PRCP')).resample('monthly')
+    crp = crp.groupby('country')
+
+    expected = crp.compute(n_workers=1, chunk_size=100)
+    monkeypatch.setattr(corpus, '_FOLD_EVERY', 2)
+    folded = crp.compute(n_workers=1, chunk_size=1)
+    pooled = crp.compute(n_workers=2, chunk_size=1)
+
+    assert len(expected) == 2 * 3 * 2 * 12
+    for df in (folded, pooled):
+        assert df[['elem', 'country', 'year', 'month', 'count']].equals(
+            expected[['elem', 'country', 'year', 'month', 'count']])
+        assert np.allclose(df['value'], expected['value'])
+
+
+def test_per_station_skips_folding(make_ghcn, monkeypatch):
+    ghcn_obj = make_ghcn(network())
+    crp = corpus.Corpus(ghcn_obj, ('TMAX', 'PRCP')).resample('monthly')
+    expected = crp.compute(n_workers=1, chunk_size=100)
+
+    # With n_workers=1 each chunk calls _aggregate() once in this process;
+    # compute() itself only builds the empty starting frame and never
+    # re-groups the parts.
+    calls = []
+    aggregate = corpus._aggregate
+    monkeypatch.setattr(corpus, '_FOLD_EVERY', 1)
+    monkeypatch.setattr(corpus, '_aggregate',
+                        lambda frames, keys: calls.append(len(frames)) or
+                        aggregate(frames, keys))
+    got = crp.compute(n_workers=1, chunk_size=1)
+
+    assert got.equals(expected)
+    assert calls.count(0) == 1 and len(calls) == 1 + len(network())
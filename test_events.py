@@ -0,0 +1,194 @@
+"""Tests for events.py and the array helpers it uses in ghcn.py.
+
+"""
+
+# pylint: disable=invalid-name, locally-disabled
+
+import datetime
+import numpy as np
+import pytest
+
+import ghcn
+import events
+
+def brute_force_runs(values, ordinals, thresh, min_len):
+    """Day-by-day reference for events.find_runs()."""
+    runs = []
+    for i, val in enumerate(values):
+        if not val > thresh:
+            continue
+        if runs and ordinals[i] - ordinals[i - 1] == 1 and \
+                values[i - 1] > thresh:
+            runs[-1][1] += 1
+            runs[-1][2] = max(runs[-1][2], val)
+        else:
+            runs.append([ordinals[i], 1, val])
+    return [r for r in runs if r[1] >= min_len]
+
+
+def day_index(date):
+    """Return a date's column in the 366 day layout."""
+    return ghcn.MONTH_BGN[date.month - 1] + date.day - 1
+
+
+def station(years, hot=(), missing=(), qflags=(), elem='TMAX'):
+    """Build a station with cool days except the given hot/missing dates."""
+    vals = {y: [100] * 366 for y in years}
+    for d in hot:
+        vals[d.year][day_index(d)] = 400 + d.day
+    for d in missing:
+        vals[d.year][day_index(d)] = None
+    return {
+        'lat': 40.0,
+        'lng': -100.0,
+        'elems': {elem: vals},
+        'qflags': set((elem, d.year, day_index(d)) for d in qflags)
+    }
+
+
+def days(first, n):
+    """Return n consecutive dates from first."""
+    return [first + datetime.timedelta(days=i) for i in range(n)]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_find_runs_matches_brute_force(seed):
+    rng = np.random.RandomState(seed)
+    ordinals = np.cumsum(rng.choice([1, 1, 1, 1, 2, 30], size=2000))
+    values = rng.normal(size=2000)
+    values[rng.rand(2000) < 0.05] = np.nan
+
+    runs = events.find_runs(values, ordinals, 0.0, min_len=2)
+    expected = brute_force_runs(values, ordinals, 0.0, 2)
+
+    assert len(runs['start']) == len(expected)
+    assert runs['start'].tolist() == [r[0] for r in expected]
+    assert runs['length'].tolist() == [r[1] for r in expected]
+    assert np.allclose(runs['peak'], [r[2] for r in expected])
+
+
+def test_find_runs_below():
+    runs = events.find_runs([5, 1, 1, 5, 0], [1, 2, 3, 4, 5], 2, above=False)
+    assert runs['start'].tolist() == [2, 5]
+    assert runs['length'].tolist() == [2, 1]
+    assert runs['peak'].tolist() == [1, 0]
+
+
+def test_day_ordinals():
+    days_ = ghcn.day_ordinals([1900, 2000, 2001])
+    assert days_['valid'].sum(axis=1).tolist() == [365, 366, 365]
+    for i, year in enumerate((1900, 2000, 2001)):
+        ords = days_['ordinals'][i][days_['valid'][i]]
+        assert ords[0] == datetime.date(year, 1, 1).toordinal()
+        assert ords[-1] == datetime.date(year, 12, 31).toordinal()
+        assert (np.diff(ords) == 1).all()
+
+
+def test_ghcndata_to_array_shapes(make_ghcn):
+    ghcn_obj = make_ghcn({'USC00000001': station((1999, 2000))})
+    gd = ghcn_obj.file_to_data('USC00000001.dly', ('TMAX', ))['data']
+
+    from_list = ghcn.ghcndata_to_array(gd, 'TMAX')
+    from_item = ghcn.ghcndata_to_array(gd[0], 'TMAX')
+    assert from_list['years'].tolist() == [1999, 2000]
+    assert np.array_equal(from_list['values'], from_item['values'],
+                          equal_nan=True)
+    assert np.isnan(from_list['values'][0, 59])  # 1999 has no Feb 29.
+    assert from_list['values'][1, 59] == 50.0
+
+    assert not len(ghcn.ghcndata_to_array(gd, 'PRCP')['years'])
+    with pytest.raises(TypeError):
+        ghcn.ghcndata_to_array(['TMAX'], 'TMAX')
+
+
+def test_detect_events_boundaries(make_ghcn):
+    years = (1999, 2000, 2002)
+    ghcn_obj = make_ghcn({
+        # Crosses New Year and a non-leap Feb 28 -> Mar 1.
+        'USC00000001':
+        station(years,
+                hot=days(datetime.date(1999, 12, 30), 4) +
+                days(datetime.date(1999, 2, 27), 3)),
+        # A missing day splits a run; a gap year (2001) ends one.
+        'USC00000002':
+        station(years,
+                hot=days(datetime.date(2000, 7, 1), 7) +
+                days(datetime.date(2000, 12, 30), 2) +
+                days(datetime.date(2002, 1, 1), 2),
+                missing=[datetime.date(2000, 7, 4)]),
+    })
+    stations = ghcn_obj.get_stations('TMAX')
+    df = events.detect_events(ghcn_obj, stations, 'TMAX', 95, 2, n_workers=1)
+
+    got = [(r.station, r.start.date(), r.length) for r in df.itertuples()]
+    assert got == [
+        ('USC00000001', datetime.date(1999, 2, 27), 3),
+        ('USC00000001', datetime.date(1999, 12, 30), 4),
+        ('USC00000002', datetime.date(2000, 7, 1), 3),
+        ('USC00000002', datetime.date(2000, 7, 5), 3),
+        ('USC00000002', datetime.date(2000, 12, 30), 2),
+        ('USC00000002', datetime.date(2002, 1, 1), 2),
+    ]
+    # Peak is the hottest day, in ºF: 400 + 31 tenths of ºC on Dec 31.
+    assert df['peak'][1] == round((400 + 31) * 0.18 + 32, 2)
+
+
+def test_detect_events_qc(make_ghcn):
+    flagged = days(datetime.date(2000, 3, 5), 4)
+    ghcn_obj = make_ghcn({
+        'USC00000001':
+        station((1999, 2000), hot=flagged, qflags=flagged),
+    })
+    stations = ghcn_obj.get_stations('TMAX')
+
+    df = events.detect_events(ghcn_obj, stations, 'TMAX', 95, 3, n_workers=1)
+    assert df.empty
+
+    df = events.detect_events(ghcn_obj,
+                              stations,
+                              'TMAX',
+                              95,
+                              3,
+                              qc=False,
+                              n_workers=1)
+    assert df['length'].tolist() == [4]
+
+
+def test_detect_events_pool_matches_serial(make_ghcn):
+    rng = np.random.RandomState(0)
+    stations = {}
+    for i in range(6):
+        hot = [
+            datetime.date(2000, 1, 1) + datetime.timedelta(days=int(d))
+            for d in rng.choice(366, 60, replace=False)
+        ]
+        stations['USC0000000' + str(i)] = station((1999, 2000), hot=hot)
+    ghcn_obj = make_ghcn(stations)
+    metadata = ghcn_obj.get_stations('TMAX')
+
+    serial = events.detect_events(ghcn_obj, metadata, 'TMAX', 80, 2,
+                                  n_workers=1)
+    pooled = events.detect_events(ghcn_obj,
+                                  metadata,
+                                  'TMAX',
+                                  80,
+                                  2,
+                                  n_workers=2,
+                                  chunk_size=2)
+    assert not serial.empty
+    assert serial.equals(pooled)
+
+
+def test_detect_events_non_temperature_units(make_ghcn):
+    ghcn_obj = make_ghcn({
+        'USC00000001':
+        station((1999, 2000),
+                hot=days(datetime.date(2000, 6, 10), 3),
+                elem='PRCP'),
+    })
+    stations = ghcn_obj.get_stations('PRCP')
+    df = events.detect_events(ghcn_obj, stations, 'PRCP', 95, 3, n_workers=1)
+
+    # Peak is the raw DLY value, tenths of mm, not converted to ºF.
+    assert df['length'].tolist() == [3]
+    assert df['peak'].tolist() == [400 + 12]